@@ -1,14 +1,26 @@
 import gzip
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from ansibullbot._text_compat import to_bytes
 
 
 def read_gzip_json_file(path):
     with gzip.open(path, 'r') as f:
-        return json.loads(f.read())
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
 def write_gzip_json_file(path, data):
+    if orjson is not None:
+        raw = orjson.dumps(data)
+    else:
+        raw = to_bytes(json.dumps(data))
     with gzip.open(path, 'w') as f:
-        f.write(to_bytes(json.dumps(data)))
+        f.write(raw)
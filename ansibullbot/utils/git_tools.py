@@ -1,16 +1,26 @@
+import concurrent.futures
 import logging
 import os
 import shutil
 import tarfile
-import tempfile
+from collections import OrderedDict
 
 import requests
 
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
 from ansibullbot._text_compat import to_text
+from ansibullbot.utils.file_tools import read_gzip_json_file, write_gzip_json_file
 from ansibullbot.utils.systemtools import run_command
 
 
 class GitRepoWrapper:
+
+    CONTENT_CACHE_SIZE = 256
+
     def __init__(self, cachedir, repo, commit=None, rebase=True, context=None):
         self._needs_rebase = rebase
         self.repo = repo
@@ -20,6 +30,15 @@ class GitRepoWrapper:
         self._is_git = True
         self.checkoutdir = None
         self._files = []
+        self._files_set = frozenset()
+        self._files_set_ctx = frozenset()
+        self._context_files = ()
+        self._by_basename = {}
+        self._content_cache = OrderedDict()
+        self._gitshow_cache = {}
+        self._email_map = {}
+        self._ever_existed = None
+        self._pygit2_repo = None
 
         # allow for null repos
         if self.repo:
@@ -38,7 +57,8 @@ class GitRepoWrapper:
             self.update(force=True)
 
     def exists(self, filename):
-        return filename in self.files
+        self.get_files()
+        return filename in self._files_set_ctx
 
     @property
     def isgit(self):
@@ -54,38 +74,73 @@ class GitRepoWrapper:
     @property
     def files(self):
         self.get_files()
-        if self.context:
-            _files = self._files[:]
-            _files = [x for x in _files if x.startswith(self.context)]
-            _files = [x.replace(self.context.rstrip('/') + '/', '') for x in _files]
-            return _files
-        return self._files
+        return self._context_files
 
     @property
     def module_files(self):
         return [x for x in self._files if x.startswith('lib/ansible/modules')]
 
+    @property
+    def _git_repo(self):
+        '''A cached pygit2 handle on the checkout [None when pygit2 is missing]'''
+        if pygit2 is None or not self._is_git:
+            return None
+        if self._pygit2_repo is None:
+            try:
+                self._pygit2_repo = pygit2.Repository(self.checkoutdir)
+            except Exception as e:
+                logging.error(e)
+                return None
+        return self._pygit2_repo
+
+    def _walk_tree_paths(self, tree, prefix=''):
+        '''Recursively flatten a pygit2 tree into a list of filepaths'''
+        paths = []
+        for entry in tree:
+            if entry.type_str == 'tree':
+                paths += self._walk_tree_paths(
+                    self._git_repo[entry.id],
+                    prefix=prefix + entry.name + '/'
+                )
+            else:
+                paths.append(prefix + entry.name)
+        return paths
+
+    def _tree_entry_id(self, tree, path):
+        try:
+            return tree[path].id
+        except KeyError:
+            return None
+
     def create_checkout(self):
         """checkout ansible"""
-        # cleanup
-        if os.path.isdir(self.checkoutdir):
-            shutil.rmtree(self.checkoutdir)
+        self._pygit2_repo = None
         if self.repo.endswith('.tar.gz'):
             self._is_git = False
 
-            tfh,tfn = tempfile.mkstemp(suffix='.tar.gz')
-
-            rr = requests.get(self.repo, stream=True)
-            with open(tfn, 'wb') as f:
-                f.write(rr.raw.read())
+            # cleanup
+            if os.path.isdir(self.checkoutdir):
+                shutil.rmtree(self.checkoutdir)
 
             os.makedirs(self.checkoutdir)
-            tar = tarfile.open(tfn, "r:gz")
-            tar.extractall(path=self.checkoutdir)
+
+            # stream the download straight into the tar reader instead of
+            # buffering the whole tarball in memory and on disk first
+            rr = requests.get(self.repo, stream=True)
+            rr.raw.decode_content = True
+            with tarfile.open(fileobj=rr.raw, mode='r|gz') as tar:
+                tar.extractall(path=self.checkoutdir)
 
         else:
-            cmd = "git clone %s %s" \
-                % (self.repo, self.checkoutdir)
+            # a fetch+reset reuses the existing pack cache and is much
+            # cheaper than re-cloning hundreds of MB of objects
+            if self.recover_checkout():
+                return
+
+            if os.path.isdir(self.checkoutdir):
+                shutil.rmtree(self.checkoutdir)
+
+            cmd = ['git', 'clone', self.repo, self.checkoutdir]
             logging.debug(cmd)
             (rc, so, se) = run_command(cmd, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
             logging.debug('rc: %s' % rc)
@@ -94,13 +149,79 @@ class GitRepoWrapper:
             if rc != 0:
                 os.makedirs(self.checkoutdir)
 
+    def recover_checkout(self):
+        '''Repair an existing clone with fetch+reset instead of a re-clone'''
+        if not os.path.isdir(os.path.join(self.checkoutdir, '.git')):
+            return False
+
+        env = {'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'}
+
+        # a pull interrupted mid-rebase leaves .git/rebase-merge behind and
+        # HEAD detached; abort it (rc is irrelevant if no rebase is running)
+        cmd = ['git', 'rebase', '--abort']
+        logging.debug(cmd)
+        run_command(cmd, cwd=self.checkoutdir)
+
+        cmd = ['git', 'fetch', '--prune', 'origin', '+refs/heads/*:refs/remotes/origin/*']
+        logging.debug(cmd)
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir, env=env)
+        if rc != 0:
+            return False
+
+        if self.commit:
+            cmd = ['git', 'checkout', '-f', self.commit]
+        else:
+            cmd = ['git', 'symbolic-ref', '--short', 'refs/remotes/origin/HEAD']
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+            remote_branch = to_text(so).strip() or 'origin/devel'
+            local_branch = remote_branch.split('/', 1)[-1]
+            # checkout -B re-attaches HEAD so the next pull --rebase works
+            cmd = ['git', 'checkout', '-f', '-B', local_branch, remote_branch]
+        logging.debug(cmd)
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir, env=env)
+        if rc != 0:
+            return False
+
+        cmd = ['git', 'clean', '-fdx']
+        logging.debug(cmd)
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+        return rc == 0
+
     def update(self, force=False):
         '''Reload everything if there are new commits'''
+        if self._is_git and self._lrev_map:
+            self._save_lrev_map()
         changed = self.manage_checkout()
-        if changed or force or not self._is_git:
-            self.get_files(force=True)
+        if changed:
+            self._pygit2_repo = None
         self.commits_by_email = None
+        self.files_by_commit = {}
         self._lrev_map = {}
+        self._email_map = {}
+        self._ever_existed = None
+        if self._is_git:
+            self._load_lrev_map()
+            self._load_email_map()
+        if changed or force or not self._is_git:
+            self._warmup()
+
+    def _warmup(self):
+        '''Overlap the independent read-only queries behind the caches'''
+        jobs = [lambda: self.get_files(force=True)]
+        if self._is_git:
+            jobs.append(self._load_commit_maps)
+
+        if self._git_repo is not None:
+            # the pygit2 handle is not thread safe; the queries are
+            # in-process anyway so there is no subprocess wait to overlap
+            for job in jobs:
+                job()
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(x) for x in jobs]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
 
     def update_checkout(self):
         """rebase + pull + update the checkout"""
@@ -108,14 +229,14 @@ class GitRepoWrapper:
 
         # get a specific commit or do a rebase
         if self.commit:
-            cmd = "cd %s; git log -1  | head -n1 | awk '{print $2}'" % self.checkoutdir
-            (rc, so, se) = run_command(cmd)
+            cmd = ['git', 'log', '-1', '--format=%H']
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
             so = to_text(so).strip()
 
             if so != self.commit:
-                cmd = "cd %s; git checkout %s" % (self.checkoutdir, self.commit)
+                cmd = ['git', 'checkout', self.commit]
                 logging.debug(cmd)
-                (rc, so, se) = run_command(cmd, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
+                (rc, so, se) = run_command(cmd, cwd=self.checkoutdir, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
                 changed = True
 
             if rc != 0:
@@ -125,9 +246,9 @@ class GitRepoWrapper:
         else:
             changed = False
 
-            cmd = "cd %s ; git pull --rebase" % self.checkoutdir
+            cmd = ['git', 'pull', '--rebase']
             logging.debug(cmd)
-            (rc, so, se) = run_command(cmd, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir, env={'GIT_TERMINAL_PROMPT': 0, 'GIT_ASKPASS': '/bin/echo'})
             so = to_text(so)
             print(so + to_text(se))
 
@@ -159,80 +280,277 @@ class GitRepoWrapper:
         '''Cache a list of filenames in the checkout'''
         if self.isgit:
             if not self._files or force:
-                cmd = f'cd {self.checkoutdir}; git ls-files'
-                logging.debug(cmd)
-                (rc, so, se) = run_command(cmd)
-                files = to_text(so).split('\n')
-                files = [x.strip() for x in files if x.strip()]
+                files = None
+                if self._git_repo is not None:
+                    try:
+                        head = self._git_repo[self._git_repo.head.target]
+                        files = self._walk_tree_paths(head.tree)
+                    except Exception as e:
+                        logging.error(e)
+                        files = None
+                if files is None:
+                    # ls-tree only reads the HEAD tree; ls-files would also
+                    # consult the index+worktree, which the bot never dirties
+                    cmd = ['git', 'ls-tree', '-r', '--name-only', 'HEAD']
+                    logging.debug(cmd)
+                    (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+                    files = to_text(so).split('\n')
+                    files = [x.strip() for x in files if x.strip()]
                 if self.context:
-                    self._files = [x for x in files if self.context in files]
-                self._files = files
+                    ctx = self.context.rstrip('/') + '/'
+                    files = [x for x in files if x.startswith(ctx)]
+                self._index_files(files)
         else:
-            self._files = []
-            cmd = f'cd {self.checkoutdir}; find .'
+            files = []
+            cmd = ['find', '.']
             logging.debug(cmd)
-            (rc, so, se) = run_command(cmd)
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
             filepaths = to_text(so).split('\n')
             for fp in filepaths:
                 if not fp.startswith('./'):
                     continue
                 fp = fp.replace('./', '', 1)
-                self._files.append(fp)
+                files.append(fp)
+            self._index_files(files)
+
+    def _index_files(self, files):
+        '''Precompute the lookup structures for exists() and find()'''
+        self._files = files
+        self._files_set = frozenset(files)
+        by_basename = {}
+        for fn in files:
+            by_basename.setdefault(os.path.basename(fn), []).append(fn)
+        self._by_basename = by_basename
+        if self.context:
+            ctx = self.context.rstrip('/') + '/'
+            self._context_files = tuple(
+                x[len(ctx):] for x in files if x.startswith(ctx)
+            )
+        else:
+            self._context_files = tuple(files)
+        self._files_set_ctx = frozenset(self._context_files)
 
     def get_files_by_commit(self, commit):
         if commit not in self.files_by_commit:
-            cmd = f'cd {self.checkoutdir}; git show --pretty="" --name-only {commit}'
-            (rc, so, se) = run_command(cmd)
-            filenames = [x.strip() for x in to_text(so).split('\n') if x.strip()]
+            filenames = None
+            if self._git_repo is not None:
+                try:
+                    _commit = self._git_repo.revparse_single(commit)
+                    if len(_commit.parents) > 1:
+                        # git show --name-only lists nothing for merges
+                        filenames = []
+                    elif _commit.parents:
+                        diff = _commit.tree.diff_to_tree(_commit.parents[0].tree)
+                        filenames = sorted(set(x.new_file.path for x in diff.deltas))
+                    else:
+                        filenames = self._walk_tree_paths(_commit.tree)
+                except Exception as e:
+                    logging.error(e)
+                    filenames = None
+            if filenames is None:
+                cmd = ['git', 'show', '--pretty=', '--name-only', commit]
+                (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+                filenames = [x.strip() for x in to_text(so).split('\n') if x.strip()]
             self.files_by_commit[commit] = filenames[:]
         else:
             filenames = self.files_by_commit[commit]
 
         return filenames
 
-    def get_commits_by_email(self, email):
-        '''Map an email(s) to a total num of commits and total by file'''
-        if self.commits_by_email is None:
-            commits = {}
-            cmd = f'cd {self.checkoutdir}; git log --format="%h;%ae"'
-            (rc, so, se) = run_command(cmd)
-            lines = [x.strip() for x in to_text(so).split('\n') if x.strip()]
-            for line in lines:
-                parts = line.split(';')
-                this_hash = parts[0]
-                this_email = parts[1]
+    @property
+    def _gitwalk_cache_file(self):
+        return self.checkoutdir.rstrip('/') + '.gitwalk.json.gz'
+
+    def _get_head_sha(self):
+        if self._git_repo is not None:
+            try:
+                return str(self._git_repo.head.target)
+            except Exception as e:
+                logging.error(e)
+        cmd = ['git', 'rev-parse', 'HEAD']
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+        return to_text(so).strip()
+
+    def _parse_name_only_log(self, so, commits, files_by_commit):
+        '''Parse __COMMIT__%h;%ae --name-only output into the two maps'''
+        this_hash = None
+        for line in to_text(so).split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('__COMMIT__'):
+                this_hash, this_email = line[len('__COMMIT__'):].split(';', 1)
                 if this_email not in commits:
                     commits[this_email] = set()
                 commits[this_email].add(this_hash)
-            self.commits_by_email = commits
+                files_by_commit[this_hash] = []
+            elif this_hash is not None:
+                files_by_commit[this_hash].append(line)
+
+    def _read_gitwalk_cache(self):
+        if not os.path.isfile(self._gitwalk_cache_file):
+            return None
+        try:
+            return read_gzip_json_file(self._gitwalk_cache_file)
+        except Exception as e:
+            logging.error(e)
+            return None
+
+    def _write_gitwalk_cache(self, head):
+        data = {
+            'head': head,
+            'commits_by_email': {k: sorted(v) for k, v in self.commits_by_email.items()},
+            'files_by_commit': self.files_by_commit,
+        }
+        write_gzip_json_file(self._gitwalk_cache_file, data)
+
+    def _load_commit_maps(self):
+        '''Fill commits_by_email and files_by_commit in a single history walk'''
+        head = self._get_head_sha()
+
+        # reuse the previous walk and only ingest new commits
+        cached = self._read_gitwalk_cache()
+        if cached and cached.get('head'):
+            commits = {k: set(v) for k, v in cached['commits_by_email'].items()}
+            files_by_commit = cached['files_by_commit']
+            if cached['head'] != head:
+                cmd = ['git', 'log', '%s..HEAD' % cached['head'], '--format=__COMMIT__%h;%ae', '--name-only']
+                logging.debug(cmd)
+                (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+                if rc != 0:
+                    # cached head is gone (rebase/force push), start over
+                    cached = None
+                else:
+                    self._parse_name_only_log(so, commits, files_by_commit)
+            if cached:
+                self.commits_by_email = commits
+                self.files_by_commit = files_by_commit
+                if cached['head'] != head:
+                    self._write_gitwalk_cache(head)
+                return
+
+        commits = None
+        files_by_commit = {}
+
+        if self._git_repo is not None:
+            try:
+                commits = {}
+                walker = self._git_repo.walk(self._git_repo.head.target, pygit2.GIT_SORT_TIME)
+                for refname in self._git_repo.references:
+                    try:
+                        walker.push(self._git_repo.references[refname].peel(pygit2.Commit).id)
+                    except Exception:
+                        continue
+                for _commit in walker:
+                    this_hash = str(_commit.id)[:7]
+                    this_email = _commit.author.email
+                    if this_email not in commits:
+                        commits[this_email] = set()
+                    commits[this_email].add(this_hash)
+                    if len(_commit.parents) > 1:
+                        # match the log fallback, which lists no files for merges
+                        files_by_commit[this_hash] = []
+                    elif _commit.parents:
+                        diff = _commit.tree.diff_to_tree(_commit.parents[0].tree)
+                        files_by_commit[this_hash] = sorted(set(x.new_file.path for x in diff.deltas))
+                    else:
+                        files_by_commit[this_hash] = self._walk_tree_paths(_commit.tree)
+            except Exception as e:
+                logging.error(e)
+                commits = None
+                files_by_commit = {}
+
+        if commits is None:
+            # one log for the whole history instead of a subprocess per commit
+            commits = {}
+            cmd = ['git', 'log', '--all', '--format=__COMMIT__%h;%ae', '--name-only']
+            logging.debug(cmd)
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+            self._parse_name_only_log(so, commits, files_by_commit)
+
+        self.commits_by_email = commits
+        self.files_by_commit = files_by_commit
+        try:
+            self._write_gitwalk_cache(head)
+        except Exception as e:
+            logging.error(e)
+
+    def get_commits_by_email(self, email):
+        '''Map an email(s) to a total num of commits and total by file'''
+        if self.commits_by_email is None:
+            self._load_commit_maps()
 
         if not isinstance(email, (set, list)):
             emails = [email]
         else:
             emails = [x for x in email]
 
-        email_map = {}
+        new_emails = False
 
         for _email in emails:
-            if _email not in email_map:
-                email_map[_email] = {
-                    'commit_count': 0,
-                    'commit_count_byfile': {}
-                }
+            if _email in self._email_map:
+                continue
+
+            entry = {
+                'commit_count': 0,
+                'commit_count_byfile': {}
+            }
 
             if _email in self.commits_by_email:
 
-                email_map[_email]['commit_count'] = \
+                entry['commit_count'] = \
                     len(self.commits_by_email[_email])
 
                 for _commit in self.commits_by_email[_email]:
                     filenames = self.get_files_by_commit(_commit)
                     for fn in filenames:
-                        if fn not in email_map[_email]['commit_count_byfile']:
-                            email_map[_email]['commit_count_byfile'][fn] = 0
-                        email_map[_email]['commit_count_byfile'][fn] += 1
+                        if fn not in entry['commit_count_byfile']:
+                            entry['commit_count_byfile'][fn] = 0
+                        entry['commit_count_byfile'][fn] += 1
+
+            self._email_map[_email] = entry
+            new_emails = True
 
-        return email_map
+        if new_emails:
+            self._save_email_map()
+
+        return {x: self._email_map[x] for x in emails}
+
+    @property
+    def _email_map_cache_file(self):
+        return self.checkoutdir.rstrip('/') + '.emailmap.json.gz'
+
+    def _save_email_map(self):
+        head = self._get_head_sha()
+        if not head:
+            return
+        try:
+            write_gzip_json_file(self._email_map_cache_file, {'head': head, 'email_map': self._email_map})
+        except Exception as e:
+            logging.error(e)
+
+    def _load_email_map(self):
+        '''Reload memoized email maps, dropping emails with new commits'''
+        self._email_map = {}
+        if not os.path.isfile(self._email_map_cache_file):
+            return
+        try:
+            data = read_gzip_json_file(self._email_map_cache_file)
+        except Exception as e:
+            logging.error(e)
+            return
+        head = self._get_head_sha()
+        email_map = data.get('email_map') or {}
+        if data.get('head') != head:
+            cmd = ['git', 'log', '%s..HEAD' % data['head'], '--format=%ae']
+            logging.debug(cmd)
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+            if rc != 0:
+                # cached head is gone, nothing can be trusted
+                return
+            for _email in set(to_text(so).split('\n')):
+                email_map.pop(_email.strip(), None)
+        self._email_map = email_map
 
     def get_last_rev_for_file(self, filepath):
         ''' Retrive last hash for a file if it ever existed '''
@@ -240,40 +558,156 @@ class GitRepoWrapper:
         # https://stackoverflow.com/a/1395463
 
         if filepath not in self._lrev_map:
-            cmd = 'cd %s; git rev-list --max-count=1 --all -- %s' % (self.checkoutdir, filepath)
-            logging.info(cmd)
-            (rc, so, se) = run_command(cmd)
-            lrev = so.strip().decode('utf-8')
+            lrev = None
+            if self._git_repo is not None:
+                try:
+                    lrev = self._find_last_rev_pygit2(filepath)
+                except Exception as e:
+                    logging.error(e)
+                    lrev = None
+            if lrev is None:
+                cmd = ['git', 'rev-list', '--max-count=1', '--all', '--', filepath]
+                logging.info(cmd)
+                (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+                lrev = so.strip().decode('utf-8')
             self._lrev_map[filepath] = lrev
 
         return self._lrev_map[filepath]
 
+    def _find_last_rev_pygit2(self, filepath):
+        '''Walk all refs in-process for the newest commit touching a path'''
+        walker = self._git_repo.walk(self._git_repo.head.target, pygit2.GIT_SORT_TIME)
+        for refname in self._git_repo.references:
+            try:
+                ref = self._git_repo.references[refname]
+                walker.push(ref.peel(pygit2.Commit).id)
+            except Exception:
+                continue
+        for commit in walker:
+            this_id = self._tree_entry_id(commit.tree, filepath)
+            if not commit.parents:
+                if this_id is not None:
+                    return str(commit.id)
+                continue
+            # a commit touched the path if no parent has the same blob
+            if all(this_id != self._tree_entry_id(x.tree, filepath) for x in commit.parents):
+                if this_id is not None or any(self._tree_entry_id(x.tree, filepath) for x in commit.parents):
+                    return str(commit.id)
+        return ''
+
+    @property
+    def _lrev_cache_file(self):
+        return self.checkoutdir.rstrip('/') + '.lrevmap.json.gz'
+
+    def _save_lrev_map(self):
+        head = self._get_head_sha()
+        if not head:
+            return
+        try:
+            write_gzip_json_file(self._lrev_cache_file, {'head': head, 'lrevs': self._lrev_map})
+        except Exception as e:
+            logging.error(e)
+
+    def _load_lrev_map(self):
+        '''Reload persisted lrevs, dropping entries for paths HEAD changed'''
+        if not os.path.isfile(self._lrev_cache_file):
+            return
+        try:
+            data = read_gzip_json_file(self._lrev_cache_file)
+        except Exception as e:
+            logging.error(e)
+            return
+        head = self._get_head_sha()
+        lrevs = data.get('lrevs') or {}
+        if data.get('head') != head:
+            cmd = ['git', 'diff', '--name-only', data['head'], head]
+            logging.debug(cmd)
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+            if rc != 0:
+                # cached head is gone, nothing can be trusted
+                return
+            for fn in to_text(so).split('\n'):
+                lrevs.pop(fn.strip(), None)
+        self._lrev_map = lrevs
+
+    def get_last_revs(self, filepaths):
+        '''Resolve last revs for many paths in a single history scan'''
+        needed = set(x for x in filepaths if x not in self._lrev_map)
+        if needed:
+            found = {}
+            cmd = ['git', 'log', '--all', '--format=__COMMIT__%H', '--name-only']
+            logging.debug(cmd)
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+            this_hash = None
+            for line in to_text(so).split('\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('__COMMIT__'):
+                    this_hash = line[len('__COMMIT__'):]
+                elif this_hash and line in needed and line not in found:
+                    found[line] = this_hash
+                    if len(found) == len(needed):
+                        break
+            for fp in needed:
+                self._lrev_map[fp] = found.get(fp, '')
+        return {x: self._lrev_map[x] for x in filepaths}
+
+    def _load_ever_existed(self):
+        '''One history scan for every path that was ever added or renamed'''
+        paths = set()
+        cmd = ['git', 'log', '--all', '--diff-filter=AR', '--name-only', '--format=']
+        logging.debug(cmd)
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
+        for line in to_text(so).split('\n'):
+            line = line.strip()
+            if line:
+                paths.add(line)
+                # callers pass directories too, which git pathspecs matched
+                parent = os.path.dirname(line)
+                while parent and parent not in paths:
+                    paths.add(parent)
+                    parent = os.path.dirname(parent)
+        self._ever_existed = paths
+
     def existed(self, filepath):
-        '''Did a file ever exist in this repo?'''
+        '''Did a file or directory ever exist in this repo?'''
         if self.context:
             filepath = os.path.join(self.context, filepath)
 
-        lrev = self.get_last_rev_for_file(filepath)
-        if lrev:
-            return True
+        if self._ever_existed is None:
+            self._load_ever_existed()
 
-        return False
+        return filepath.rstrip('/') in self._ever_existed
 
     def get_file_content(self, filepath, follow=False):
         fp = os.path.join(self.checkoutdir, filepath)
         if os.path.exists(fp):
+            # the same files are read over and over during triage, so keep
+            # the decoded content around as long as the file is unchanged
+            st = os.stat(fp)
+            ckey = (fp, st.st_mtime_ns, st.st_size)
+            data = self._content_cache.get(ckey)
+            if data is not None:
+                self._content_cache.move_to_end(ckey)
+                return data
             with open(fp, 'r', encoding='utf-8') as f:
                 data = f.read()
+            self._content_cache[ckey] = data
+            while len(self._content_cache) > self.CONTENT_CACHE_SIZE:
+                self._content_cache.popitem(last=False)
             return data
 
         if not follow:
             return None
 
         lrev = self.get_last_rev_for_file(filepath)
+        if (lrev, filepath) in self._gitshow_cache:
+            return self._gitshow_cache[(lrev, filepath)]
 
         # https://stackoverflow.com/a/1395463
-        cmd = 'cd %s; git show %s^:%s' % (self.checkoutdir, lrev, filepath)
-        (rc, so, se) = run_command(cmd)
+        cmd = ['git', 'show', '%s^:%s' % (lrev, filepath)]
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
         logging.info(cmd)
         so = so.strip()
         if so.decode('utf-8').endswith('.py'):
@@ -281,18 +715,29 @@ class GitRepoWrapper:
             newpath = os.path.join(newpath, so.decode('utf-8'))
             lrev = self.get_last_rev_for_file(filepath)
 
-            cmd = 'cd %s; git show %s^:%s' % (self.checkoutdir, lrev, newpath)
+            cmd = ['git', 'show', '%s^:%s' % (lrev, newpath)]
             logging.info(cmd)
-            (rc, so, se) = run_command(cmd)
+            (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
             so = so.strip()
 
+        self._gitshow_cache[(lrev, filepath)] = so
+
         return so
 
     def find(self, pattern):
-        if pattern in self._files:
+        if pattern in self._files_set:
             return pattern
+        # a path suffix can only match files with the exact same basename,
+        # so only those candidates need the full endswith check
+        if '/' in pattern:
+            candidates = self._by_basename.get(os.path.basename(pattern), ())
+        else:
+            candidates = []
+            for basename, paths in self._by_basename.items():
+                if basename.endswith(pattern):
+                    candidates += paths
         matches = set()
-        for fn in self._files:
+        for fn in candidates:
             if self.context and self.context not in fn:
                 continue
             if fn.endswith(pattern):
@@ -300,8 +745,14 @@ class GitRepoWrapper:
         return matches
 
     def list_files_by_branch(self, branch):
-        cmd = "cd %s; git ls-tree -r --name-only %s" % (self.checkoutdir, branch)
+        if self._git_repo is not None:
+            try:
+                commit = self._git_repo.revparse_single(branch)
+                return self._walk_tree_paths(commit.peel(pygit2.Commit).tree)
+            except Exception as e:
+                logging.error(e)
+        cmd = ['git', 'ls-tree', '-r', '--name-only', branch]
         logging.info(cmd)
-        (rc, so, se) = run_command(cmd)
+        (rc, so, se) = run_command(cmd, cwd=self.checkoutdir)
         res = so.strip().decode('utf-8')
         return res.splitlines()
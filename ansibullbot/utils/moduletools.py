@@ -1,4 +1,5 @@
 import copy
+import functools
 import logging
 import os
 import pickle
@@ -19,6 +20,34 @@ from ansibullbot.utils.timetools import strip_time_safely
 
 Base = declarative_base()
 
+# compiled once; these run against every author line of every module file
+GITHUB_ID_RE = re.compile(r'(?<!\w)@([\w-]+)(?![\w.])')
+EMAIL_RE = re.compile(r'[<(]([^@]+@[^)>]+)[)>]')
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_author_line(author):
+    '''The deterministic part of extract_github_id, memoized per raw line'''
+    authors = set()
+
+    if 'ansible core team' in author.lower():
+        authors.add('ansible')
+    elif '@' in author:
+        # match github ids but not emails
+        authors.update(GITHUB_ID_RE.findall(author))
+    elif 'github.com/' in author:
+        # {'author': 'Henrique Rodrigues (github.com/Sodki)'}
+        idx = author.find('github.com/')
+        author = author[idx+11:]
+        authors.add(author.replace(')', ''))
+    elif '(' in author and len(author.split()) == 3:
+        # Mathieu Bultel (matbu)
+        idx = author.find('(')
+        author = author[idx+1:]
+        authors.add(author.replace(')', ''))
+
+    return frozenset(authors), tuple(EMAIL_RE.findall(author))
+
 
 class Blame(Base):
     __tablename__ = 'blames'
@@ -534,28 +563,14 @@ class ModuleIndexer:
         return authors
 
     def extract_github_id(self, author):
-        authors = set()
-
         if author is None:
             return []
-        if 'ansible core team' in author.lower():
-            authors.add('ansible')
-        elif '@' in author:
-            # match github ids but not emails
-            authors.update(re.findall(r'(?<!\w)@([\w-]+)(?![\w.])', author))
-        elif 'github.com/' in author:
-            # {'author': 'Henrique Rodrigues (github.com/Sodki)'}
-            idx = author.find('github.com/')
-            author = author[idx+11:]
-            authors.add(author.replace(')', ''))
-        elif '(' in author and len(author.split()) == 3:
-            # Mathieu Bultel (matbu)
-            idx = author.find('(')
-            author = author[idx+1:]
-            authors.add(author.replace(')', ''))
-
-        # search for emails
-        for email in re.findall(r'[<(]([^@]+@[^)>]+)[)>]', author):
+
+        handles, emails = _parse_author_line(author)
+        authors = set(handles)
+
+        # search for emails; the cache is live so this part is not memoized
+        for email in emails:
             github_id = self.emails_cache.get(email)
             if github_id:
                 authors.add(github_id)
@@ -1,10 +1,18 @@
+import gzip
 import json
 import logging
 import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from sqlalchemy import create_engine
 from sqlalchemy import Column
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -54,6 +62,14 @@ class GithubApiRequest(Base):
     token = Column(String)
 
 
+class ResponseCache(Base):
+    __tablename__ = 'response_cache'
+    url = Column(String(), primary_key=True)
+    etag = Column(String())
+    body = Column(LargeBinary())
+    inserted_at = Column(Integer())
+
+
 class AnsibullbotDatabase:
 
     '''A sqlite backed database to help with data caching [NOT CONFIG]'''
@@ -96,6 +112,7 @@ class AnsibullbotDatabase:
                 Blame.metadata.create_all(self.engine)
                 RateLimit.metadata.create_all(self.engine)
                 GithubApiRequest.metadata.create_all(self.engine)
+                ResponseCache.metadata.create_all(self.engine)
                 break
             except Exception as e:
                 retries += 1
@@ -154,6 +171,85 @@ class AnsibullbotDatabase:
         except Exception as e:
             logging.error(e)
 
+    def get_cached_response(self, url):
+
+        '''Fetch the etag and decoded body for a cached api response'''
+
+        try:
+            row = self.session.query(ResponseCache).filter(ResponseCache.url == url).first()
+        except Exception as e:
+            logging.error(e)
+            return None
+
+        if row is None:
+            return None
+
+        data = None
+        if row.body is not None:
+            try:
+                raw = gzip.decompress(row.body)
+                if orjson is not None:
+                    data = orjson.loads(raw)
+                else:
+                    data = json.loads(raw)
+            except Exception as e:
+                logging.error(e)
+                return None
+
+        return {'url': row.url, 'etag': row.etag, 'data': data}
+
+    def set_cached_response(self, url, etag=None, data=None):
+
+        '''Store an api response body+etag as a compressed blob'''
+
+        if orjson is not None:
+            raw = orjson.dumps(data)
+        else:
+            raw = json.dumps(data).encode('utf-8')
+
+        kwargs = {
+            'url': url,
+            'etag': etag,
+            'body': gzip.compress(raw),
+            'inserted_at': int(time.time())
+        }
+
+        row = ResponseCache(**kwargs)
+        self.session.merge(row)
+        try:
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+
+    def migrate_response_files(self, cached_requests_dir):
+
+        '''One-shot import of the legacy per-url json.gz cache files'''
+
+        if not os.path.isdir(cached_requests_dir):
+            return 0
+
+        imported = 0
+        for root, _, filenames in os.walk(cached_requests_dir):
+            for fn in filenames:
+                if not fn.endswith('.json.gz'):
+                    continue
+                fpath = os.path.join(root, fn)
+                url = 'https://' + os.path.relpath(fpath, cached_requests_dir)[:-len('.json.gz')]
+                if self.session.query(ResponseCache).filter(ResponseCache.url == url).first():
+                    continue
+                meta = self.get_github_api_request_meta(url)
+                try:
+                    with gzip.open(fpath, 'r') as f:
+                        data = json.loads(f.read())
+                except Exception as e:
+                    logging.error(e)
+                    continue
+                self.set_cached_response(url, etag=meta.get('etag'), data=data)
+                imported += 1
+
+        return imported
+
     def set_rate_limit(self, username=None, token=None, rawjson=None):
 
         '''Store the ratelimit json data by user/token'''
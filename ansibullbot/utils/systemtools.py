@@ -10,6 +10,8 @@ def run_command(cmd, cwd=None, env=None):
         env = copy.deepcopy(_env)
         for k, v in env.items():
             env[k] = str(v)
-    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
+    # argv lists skip the shell fork+parse entirely
+    shell = not isinstance(cmd, (list, tuple))
+    p = subprocess.Popen(cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
     (so, se) = p.communicate()
     return p.returncode, so, se
@@ -1,12 +1,21 @@
-import json
+import concurrent.futures
 import logging
 import os
-import pickle
 import requests
 import shutil
+from collections import namedtuple
 from datetime import datetime
+from urllib.parse import parse_qs, urlencode, urlparse
 
 from github import Github
+from github.Issue import Issue
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 import ansibullbot.constants as C
 
@@ -14,10 +23,29 @@ from ansibullbot.decorators.github import RateLimited
 from ansibullbot.errors import RateLimitError
 from ansibullbot.utils.file_tools import read_gzip_json_file, write_gzip_json_file
 from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
+from ansibullbot.utils.timetools import strip_time_safely
 
 
 ADB = AnsibullbotDatabase()
 
+# lightweight cache-friendly stand-ins for the PyGithub objects; call
+# sites only consume .name/.color and .login
+Label = namedtuple('Label', ['name', 'color'])
+User = namedtuple('User', ['login'])
+
+_EVENT_TYPES = {
+    'labels': Label,
+    'assignees': User,
+}
+
+
+def _response_json(rr):
+    '''Decode a response body in C instead of the stdlib tokenizer'''
+    if orjson is not None:
+        return orjson.loads(rr.content)
+    return rr.json()
+
+
 HEADERS = [
     'application/json',
     'application/vnd.github.mockingbird-preview',
@@ -35,6 +63,23 @@ class GithubWrapper:
         self.cachedir = os.path.expanduser(cachedir)
         self.cached_requests_dir = os.path.join(self.cachedir, 'cached_requests')
 
+        # pull any pre-sqlite response cache into the database once
+        if os.path.isdir(self.cached_requests_dir):
+            imported = ADB.migrate_response_files(self.cached_requests_dir)
+            logging.info('imported %s cached responses' % imported)
+            os.rename(self.cached_requests_dir, self.cached_requests_dir + '.migrated')
+
+        # reuse TCP+TLS connections instead of a fresh handshake per call
+        self._session = requests.Session()
+        self._session.mount(
+            'https://',
+            HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=32,
+                max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504]),
+            )
+        )
+
     @RateLimited
     def _connect(self, url, user, passw, token):
         """Connects to GitHub's API"""
@@ -75,52 +120,40 @@ class GithubWrapper:
 
     @RateLimited
     def get_cached_request(self, url):
-        '''Use a combination of sqlite and ondisk caching to GET an api resource'''
+        '''Use the sqlite response cache to GET an api resource'''
         url_parts = url.split('/')
 
-        cdf = os.path.join(self.cached_requests_dir, url.replace('https://', '') + '.json.gz')
-        cdd = os.path.dirname(cdf)
-        if not os.path.exists(cdd):
-            os.makedirs(cdd)
+        cached = ADB.get_cached_response(url)
 
         # FIXME - commits are static and can always be used from cache.
-        if url_parts[-2] == 'commits' and os.path.exists(cdf):
-            return read_gzip_json_file(cdf)
+        if url_parts[-2] == 'commits' and cached:
+            return cached['data']
 
         headers = {
             'Accept': ','.join(HEADERS),
             'Authorization': 'Bearer %s' % self.token,
         }
 
-        meta = ADB.get_github_api_request_meta(url, token=self.token)
-        if meta is None:
-            meta = {}
-
         # https://developer.github.com/v3/#conditional-requests
-        etag = meta.get('etag')
-        if etag and os.path.exists(cdf):
-            headers['If-None-Match'] = etag
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
 
-        rr = requests.get(url, headers=headers)
+        rr = self._session.get(url, headers=headers)
 
         if rr.status_code == 304:
             # not modified
-            with open(cdf) as f:
-                data = json.loads(f.read())
+            data = cached['data']
         else:
-            data = rr.json()
+            data = _response_json(rr)
 
             # handle ratelimits ...
             if isinstance(data, dict) and data.get('message'):
                 if data['message'].lower().startswith('api rate limit exceeded'):
                     raise RateLimitError()
 
-            # cache data to disk
-            logging.debug('write %s' % cdf)
-            write_gzip_json_file(cdf, data)
-
-        # save the meta
-        ADB.set_github_api_request_meta(url, rr.headers, cdf, token=self.token)
+            # cache the response as a single row instead of a file per url
+            logging.debug('cache %s' % url)
+            ADB.set_cached_response(url, etag=rr.headers.get('ETag'), data=data)
 
         # pagination
         if hasattr(rr, 'links') and rr.links and rr.links.get('next'):
@@ -141,24 +174,75 @@ class GithubWrapper:
             'Authorization': 'Bearer %s' % self.token,
         }
 
-        rr = requests.get(url, headers=headers)
-        data = rr.json()
+        rr = self._session.get(url, headers=headers)
+        data = self._check_response_data(_response_json(rr))
+
+        links = getattr(rr, 'links', None) or {}
+        if not links.get('next'):
+            return data
+
+        # pagination
+        page_urls = self._remaining_page_urls(links)
+        if page_urls:
+            # the last page is announced, so fan the rest out concurrently
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                responses = executor.map(
+                    lambda _url: self._session.get(_url, headers=headers),
+                    page_urls
+                )
+                for _rr in responses:
+                    data = self._merge_page(data, self._check_response_data(_response_json(_rr)))
+            return data
+
+        # unknown page count; fetch the next page while merging the current one
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._session.get, links['next']['url'], headers=headers)
+            while future is not None:
+                _rr = future.result()
+                _links = getattr(_rr, 'links', None) or {}
+                if _links.get('next'):
+                    future = executor.submit(self._session.get, _links['next']['url'], headers=headers)
+                else:
+                    future = None
+                data = self._merge_page(data, self._check_response_data(_response_json(_rr)))
 
+        return data
+
+    @staticmethod
+    def _check_response_data(data):
         # handle ratelimits ...
         if isinstance(data, dict) and data.get('message'):
             if data['message'].lower().startswith('api rate limit exceeded'):
                 raise RateLimitError()
+        return data
 
-        # pagination
-        if hasattr(rr, 'links') and rr.links and rr.links.get('next'):
-            _data = self.get_request(rr.links['next']['url'])
-            if isinstance(data, list):
-                data += _data
-            elif isinstance(data, dict):
-                data.update(_data)
-
+    @staticmethod
+    def _merge_page(data, pagedata):
+        if isinstance(data, list):
+            data += pagedata
+        elif isinstance(data, dict):
+            data.update(pagedata)
         return data
 
+    @staticmethod
+    def _remaining_page_urls(links):
+        '''Expand next..last into explicit page urls when last is known'''
+        last_url = (links.get('last') or {}).get('url')
+        if not last_url:
+            return None
+        parsed = urlparse(links['next']['url'])
+        query = parse_qs(parsed.query)
+        try:
+            next_page = int(query['page'][0])
+            last_page = int(parse_qs(urlparse(last_url).query)['page'][0])
+        except (KeyError, ValueError):
+            return None
+        urls = []
+        for page in range(next_page, last_page + 1):
+            query['page'] = [str(page)]
+            urls.append(parsed._replace(query=urlencode(query, doseq=True)).geturl())
+        return urls
+
     @RateLimited
     def delete_request(self, url):
         headers = {
@@ -166,7 +250,7 @@ class GithubWrapper:
             'Authorization': 'Bearer %s' % self.token,
         }
 
-        rr = requests.delete(url, headers=headers)
+        rr = self._session.delete(url, headers=headers)
         return rr.ok
 
 
@@ -245,22 +329,30 @@ class RepoWrapper:
         if not C.DEFAULT_PICKLE_ISSUES:
             return False
 
-        pfile = os.path.join(
+        cfile = os.path.join(
             self.cachedir,
             'issues',
             str(number),
-            'issue.pickle'
+            'issue.json.gz'
         )
-        if os.path.isfile(pfile):
-            with open(pfile, 'rb') as f:
-                try:
-                    issue = pickle.load(f)
-                except TypeError:
-                    return False
-            return issue
-        else:
+        if not os.path.isfile(cfile):
             return False
 
+        try:
+            cdata = read_gzip_json_file(cfile)
+        except Exception as e:
+            logging.debug(e)
+            return False
+
+        # rebuild a live object from the stored attributes rather than
+        # unpickling a whole object graph with requester back-references
+        return Issue(
+            self.repo._requester,
+            cdata.get('headers') or {},
+            cdata['raw_data'],
+            completed=True
+        )
+
     def save_issue(self, issue):
         if not C.DEFAULT_PICKLE_ISSUES:
             return
@@ -269,44 +361,45 @@ class RepoWrapper:
             self.cachedir,
             'issues',
             str(issue.number),
-            'issue.pickle'
+            'issue.json.gz'
         )
         cdir = os.path.dirname(cfile)
         if not os.path.isdir(cdir):
             os.makedirs(cdir)
         logging.debug('dump %s' % cfile)
-        with open(cfile, 'wb') as f:
-            pickle.dump(issue, f)
+        write_gzip_json_file(cfile, {
+            'headers': dict(issue.raw_headers or {}),
+            'raw_data': issue.raw_data,
+        })
 
     @RateLimited
     def load_update_fetch(self, property_name):
         '''Fetch a get() property for an object'''
 
-        edata = None
         events = []
         updated = None
         update = False
         write_cache = False
         self.repo.update()
 
-        pfile = os.path.join(self.cachedir, '%s.pickle' % property_name)
+        pfile = os.path.join(self.cachedir, '%s.json.gz' % property_name)
         pdir = os.path.dirname(pfile)
 
         if not os.path.isdir(pdir):
             os.makedirs(pdir)
 
         if os.path.isfile(pfile):
+            edata = None
             try:
-                with open(pfile, 'rb') as f:
-                    edata = pickle.load(f)
+                edata = read_gzip_json_file(pfile)
             except Exception:
                 update = True
                 write_cache = True
 
             # check the timestamp on the cache
             if edata:
-                updated = edata[0]
-                events = edata[1]
+                updated = strip_time_safely(edata['updated'])
+                events = [_EVENT_TYPES[property_name](*x) for x in edata['events']]
                 if updated < self.repo.updated_at:
                     update = True
                     write_cache = True
@@ -316,14 +409,20 @@ class RepoWrapper:
             write_cache = True
             updated = datetime.utcnow()
             methodToCall = getattr(self.repo, 'get_' + property_name)
-            events = [x for x in methodToCall()]
+            # project to primitives so the cache never holds live objects
+            # with requester back-references
+            if property_name == 'labels':
+                events = [Label(x.name, x.color) for x in methodToCall()]
+            else:
+                events = [User(x.login) for x in methodToCall()]
 
         if C.DEFAULT_PICKLE_ISSUES:
             if write_cache or not os.path.isfile(pfile):
-                # need to dump the pickle back to disk
-                edata = [updated, events]
-                with open(pfile, 'wb') as f:
-                    pickle.dump(edata, f)
+                # need to dump the cache back to disk
+                write_gzip_json_file(pfile, {
+                    'updated': updated.isoformat(),
+                    'events': [list(x) for x in events],
+                })
 
         return events
 
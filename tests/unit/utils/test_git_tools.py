@@ -0,0 +1,147 @@
+import os
+import subprocess
+
+from unittest import mock
+
+import pytest
+
+import ansibullbot.utils.git_tools as git_tools
+
+from ansibullbot.utils.git_tools import GitRepoWrapper
+
+
+EMAIL = 'tester@example.com'
+
+
+def _git(args, cwd):
+    subprocess.run(
+        ['git'] + args,
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+@pytest.fixture
+def srcrepo(tmp_path):
+    repo = tmp_path / 'srcrepo'
+    repo.mkdir()
+    _git(['init', '-b', 'master'], repo)
+    _git(['config', 'user.email', EMAIL], repo)
+    _git(['config', 'user.name', 'tester'], repo)
+
+    moduledir = repo / 'lib' / 'ansible' / 'modules'
+    moduledir.mkdir(parents=True)
+    (moduledir / 'ping.py').write_text('# ping\n')
+    (repo / 'README.md').write_text('readme\n')
+    _git(['add', '.'], repo)
+    _git(['commit', '-m', 'first commit'], repo)
+
+    _git(['checkout', '-b', 'feature'], repo)
+    (moduledir / 'pong.py').write_text('# pong\n')
+    _git(['add', '.'], repo)
+    _git(['commit', '-m', 'add pong'], repo)
+
+    _git(['checkout', 'master'], repo)
+    _git(['merge', '--no-ff', 'feature', '-m', 'merge feature'], repo)
+
+    return str(repo)
+
+
+@pytest.fixture
+def gitrepo(srcrepo, tmp_path):
+    # force the subprocess arm; the pygit2 arm is exercised separately
+    with mock.patch.object(git_tools, 'pygit2', None):
+        yield GitRepoWrapper(str(tmp_path / 'cache'), srcrepo)
+
+
+def _subprocess_wrapper(srcrepo, cachedir):
+    with mock.patch.object(git_tools, 'pygit2', None):
+        return GitRepoWrapper(str(cachedir), srcrepo)
+
+
+def test_get_files(gitrepo):
+    assert 'README.md' in gitrepo.files
+    assert gitrepo.exists('lib/ansible/modules/ping.py')
+    assert not gitrepo.exists('lib/ansible/modules/nope.py')
+    assert gitrepo.find('ping.py') == {'lib/ansible/modules/ping.py'}
+
+
+def test_get_commits_by_email(gitrepo):
+    entry = gitrepo.get_commits_by_email(EMAIL)[EMAIL]
+    assert entry['commit_count'] == 3
+    # the merge commit contributes no files
+    assert entry['commit_count_byfile']['lib/ansible/modules/ping.py'] == 1
+    assert entry['commit_count_byfile']['lib/ansible/modules/pong.py'] == 1
+
+    entry = gitrepo.get_commits_by_email('nobody@example.com')['nobody@example.com']
+    assert entry['commit_count'] == 0
+
+
+def test_existed(gitrepo):
+    assert gitrepo.existed('lib/ansible/modules/ping.py')
+    # directories match like the old rev-list pathspec probe did
+    assert gitrepo.existed('lib/ansible/modules')
+    assert not gitrepo.existed('lib/ansible/modules/nope.py')
+
+
+def test_get_last_revs(gitrepo):
+    lrev = gitrepo.get_last_rev_for_file('README.md')
+    assert lrev
+
+    lrevs = gitrepo.get_last_revs(['README.md', 'lib/ansible/modules/pong.py', 'nope.py'])
+    assert lrevs['README.md'] == lrev
+    assert lrevs['lib/ansible/modules/pong.py']
+    assert lrevs['nope.py'] == ''
+
+
+def test_gitwalk_cache_reload(gitrepo, srcrepo, tmp_path):
+    gitrepo.get_commits_by_email(EMAIL)
+    assert os.path.isfile(gitrepo._gitwalk_cache_file)
+    assert os.path.isfile(gitrepo._email_map_cache_file)
+
+    warm = _subprocess_wrapper(srcrepo, tmp_path / 'cache')
+    assert warm.commits_by_email == gitrepo.commits_by_email
+    assert warm.files_by_commit == gitrepo.files_by_commit
+    # the memoized email entry survived the restart
+    assert warm._email_map[EMAIL]['commit_count'] == 3
+
+
+def test_gitwalk_cache_refresh(gitrepo, srcrepo, tmp_path):
+    gitrepo.get_commits_by_email(EMAIL)
+
+    with open(os.path.join(srcrepo, 'newfile.py'), 'w') as f:
+        f.write('# new\n')
+    _git(['add', '.'], srcrepo)
+    _git(['commit', '-m', 'add newfile'], srcrepo)
+
+    warm = _subprocess_wrapper(srcrepo, tmp_path / 'cache')
+    entry = warm.get_commits_by_email(EMAIL)[EMAIL]
+    assert entry['commit_count'] == 4
+    assert entry['commit_count_byfile']['newfile.py'] == 1
+
+
+def test_lrev_cache_reload(gitrepo, srcrepo, tmp_path):
+    lrev = gitrepo.get_last_rev_for_file('README.md')
+    # the lrev map is persisted on the next update
+    gitrepo.update()
+    assert os.path.isfile(gitrepo._lrev_cache_file)
+
+    warm = _subprocess_wrapper(srcrepo, tmp_path / 'cache')
+    assert warm._lrev_map['README.md'] == lrev
+
+
+@pytest.mark.skipif(git_tools.pygit2 is None, reason='pygit2 is not installed')
+def test_pygit2_arm_matches_subprocess(srcrepo, tmp_path):
+    fast = GitRepoWrapper(str(tmp_path / 'cache_fast'), srcrepo)
+    assert fast._git_repo is not None
+    slow = _subprocess_wrapper(srcrepo, tmp_path / 'cache_slow')
+
+    assert sorted(fast.files) == sorted(slow.files)
+    assert fast.commits_by_email == slow.commits_by_email
+    assert {k: sorted(v) for k, v in fast.files_by_commit.items()} == \
+        {k: sorted(v) for k, v in slow.files_by_commit.items()}
+    assert fast.get_commits_by_email(EMAIL) == slow.get_commits_by_email(EMAIL)
+    for filepath in ('README.md', 'lib/ansible/modules/pong.py'):
+        assert fast.get_last_rev_for_file(filepath) == slow.get_last_rev_for_file(filepath)
@@ -39,6 +39,26 @@ def test_db_file_corrupted():
             assert os.path.exists(ADB2.dbfile)
 
 
+def test_set_and_get_cached_response():
+
+    with tempfile.TemporaryDirectory() as cachedir:
+        unc = 'sqlite:///' + cachedir + '/test.db'
+
+        with mock.patch('ansibullbot.utils.sqlite_utils.C.DEFAULT_DATABASE_UNC', unc):
+
+            ADB = AnsibullbotDatabase(cachedir=cachedir)
+
+            url = 'https://api.github.com/repos/test/test/issues/1'
+            data = {'number': 1, 'title': 'test issue'}
+
+            ADB.set_cached_response(url, etag='W/"abcd1234"', data=data)
+            cached = ADB.get_cached_response(url)
+
+            assert cached['etag'] == 'W/"abcd1234"'
+            assert cached['data'] == data
+            assert ADB.get_cached_response('https://api.github.com/unknown') is None
+
+
 def test_set_and_get_rate_limit():
 
     with tempfile.TemporaryDirectory() as cachedir:
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 import tempfile
 
@@ -7,13 +9,16 @@ from ansibullbot.errors import RateLimitError
 from ansibullbot.wrappers.ghapiwrapper import GithubWrapper
 
 
-response_mock = Mock()
-response_mock.json.return_value = {
+response_data = {
     'documentation_url': 'https://developer.github.com/v3/#rate-limiting',
     'message': 'API rate limit exceeded for user ID XXXXX.'
 }
+response_mock = Mock()
+response_mock.json.return_value = response_data
+response_mock.content = json.dumps(response_data).encode('utf-8')
 requests = Mock()
 requests.get.side_effect = lambda url, headers: response_mock
+requests.Session.return_value.get.side_effect = lambda url, headers: response_mock
 
 
 @patch('ansibullbot.decorators.github.C.DEFAULT_RATELIMIT', False)